@@ -1,87 +1,55 @@
+import hashlib
+import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
-from utils.chunker import TextChunker
-from utils.cleaner import TextCleaner
-from utils.embedding import EmbeddingGenerator
-from utils.loader import PDFLoader
-from utils.vectorstore import VectorStore
+# Only light modules at the top: Streamlit re-executes this script on every
+# interaction, and langchain/faiss/pypdf are imported lazily by utils.resources
+# or by the ingestion block when they are first needed.
+from utils import metrics
+from utils.rag import stream_rag_answer
+from utils.resources import (
+    get_context_builder,
+    get_subheading,
+    get_summarizer,
+    get_vectorstore,
+)
 
 load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
 if "chat_history" not in st.session_state:
     st.session_state["chat_history"] = []
 
-def generate_rag_answer(query, vectorstore, history):
-    # Prepare chat history as text
-    history_text = "\n".join(
-        [f"{msg['role'].upper()}: {msg['content']}" for msg in history]
-    )
-
-    results = vectorstore.search(query, top_k=3)
-    context = "\n\n".join(results) if results else "No relevant context found."
-
-    prompt = f"""
-    You are an AI RAG Assistant.
-
-    Use ONLY the context below + conversation history to answer.
-
-    === RAG CONTEXT ===
-    {context}
-
-    === CHAT HISTORY ===
-    {history_text}
+if "history_summary" not in st.session_state:
+    st.session_state["history_summary"] = {}
 
-    === USER QUESTION ===
-    {query}
+def current_summary():
+    # Adopt the background summary update once it has finished; until then the previous one is used
+    pending = st.session_state.get("summary_update")
+    if pending is not None and pending.done():
+        st.session_state["history_summary"] = pending.result()
+        st.session_state["summary_update"] = None
+    return st.session_state["history_summary"]
 
-    Provide a helpful and contextual reply.
-    """
-
-    llm = ChatOpenAI(model="gpt-4o-mini")
-    response = llm.invoke(prompt)
-
-    return response.content
+def save_upload(upload):
+    name, data = upload
+    path = f"uploaded_pdfs/{name}"
+    with open(path, "wb") as pdf:
+        pdf.write(data)
+    return path
 
 def generate_summary(chunks, summary_type="detailed"):
-    # Join all chunks into a single text block
-    full_text = "\n\n".join(chunks)
-
-    prompt = f"""
-You are an AI Research Assistant specialized in summarization.
-
-Summarize the following document.
-
-Summary type: {summary_type}
-
-DOCUMENT CONTENT:
-{full_text}
-
-Rules:
-- Do NOT add extra information.
-- Keep the summary clean and structured.
-- If summary_type = "bullet", return bullet points.
-- If short, keep within 150 words.
-- If detailed, keep within 500 words.
-"""
-
-    result = llm.invoke(prompt)
-
-    return result.content.strip()
+    # Map-reduce over token-budgeted batches; only the final reduce depends on summary_type
+    with metrics.timed("summarize"):
+        return get_summarizer().summarize(chunks, summary_type)
 
 st.set_page_config(page_title="AI Assistant", layout="wide")
 
-if "vectorstore" not in st.session_state:
-    print("Initializing VectorStore...")
-    st.session_state["vectorstore"] = VectorStore()
-
 with st.sidebar:
     st.title("📄 Documents")
     uploaded_files = st.file_uploader(
@@ -96,6 +64,17 @@ with st.sidebar:
         else:
             st.toast("Please upload at least one document.", icon="⚠️")
 
+    if st.checkbox("Show diagnostics"):
+        data = metrics.snapshot()
+        st.caption("Stage timings (this process)")
+        st.dataframe(
+            [{"stage": stage, **{k: round(v, 2) for k, v in stats.items()}}
+             for stage, stats in sorted(data["stages"].items())],
+            hide_index=True
+        )
+        st.caption("Counters")
+        st.json(data["counters"])
+
 st.title("📚 AI Assistant")
 
 tab_chat, tab_summary = st.tabs(["💬 Chat", "📝 Summary"])
@@ -105,43 +84,44 @@ if st.session_state.get("process_docs", False):
     # START STATUS
     with status_placeholder.status("Processing your documents...", expanded=False) as status:
 
+        from utils.ingest import ingest_pdfs
+
+        store = get_vectorstore()
+
         # 1. Create folder
         os.makedirs("uploaded_pdfs", exist_ok=True)
 
-        # 2. Save PDFs
-        pdf_paths = []
+        # 2. Hash uploads; only write files that are not indexed yet, each content once
+        uploads = {}
         for f in uploaded_files:
-            path = f"uploaded_pdfs/{f.name}"
-            with open(path, "wb") as pdf:
-                pdf.write(f.read())
-            pdf_paths.append(path)
+            data = f.getvalue()
+            uploads.setdefault(hashlib.sha256(data).hexdigest(), (f.name, data))
+        hashes = list(uploads)
+        known_hashes = {h for h in hashes if store.has_file(h)}
+        new_uploads = [u for h, u in uploads.items() if h not in known_hashes]
 
-        # 3. Load
-        loader = PDFLoader(pdf_paths)
-        docs = loader.load_pdfs()
+        with ThreadPoolExecutor() as pool:
+            pdf_paths = list(pool.map(save_upload, new_uploads))
 
-        # 4. Clean & chunk
-        cleaner = TextCleaner()
-        chunker = TextChunker()
+        # 3. Load pages in parallel -> 4. clean & chunk each page -> 5. embed & store in batches
+        def report_progress(page, seen):
+            status.update(label=f"Reading {os.path.basename(page['filename'])} "
+                                f"({seen}/{page['page_count']} pages)...")
 
-        chunks = []
-        for d in docs:
-            clean = cleaner.clean(d["text"])
-            chunks.extend(chunker.chunk_text(clean))
+        added = ingest_pdfs(store, pdf_paths, skip_hashes=known_hashes, on_page=report_progress)
 
         # Prevent crash
-        if len(chunks) == 0:
+        if added == 0 and not known_hashes:
             status.update(label="❌ No text found. Cannot process.", state="error")
             st.session_state["process_docs"] = False
             st.stop()
 
-        # 5. Embed
-        embedder = EmbeddingGenerator()
-        embeddings = embedder.embed(chunks)
+        store.mark_files(set(hashes))
 
-        # 6. Store
-        store = st.session_state["vectorstore"]
-        store.add(chunks)
+        # Chunks of every uploaded file, in document order, for the summary tab
+        chunks = store.texts_for_files(set(hashes))
+
+        metrics.log_snapshot()
 
         # SUCCESS MESSAGE (THIS WILL SHOW!)
         status.update(
@@ -157,20 +137,8 @@ if st.session_state.get("process_docs", False):
     st.session_state["chunks"] = chunks
     st.session_state["process_docs"] = False
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "You are a creative branding expert. Your job is to craft short, catchy, and modern subheadings for digital products. "
-     "Make it sound premium, memorable, and friendly. Output only the subheading, without quotes."),
-
-    ("human",
-     "Create a cool subheading for my AI chatbot that helps users with answers, assistance, and conversations.")
-])
-
-formatted_messages = prompt.format_messages()
-
-response = llm.invoke(formatted_messages)
-
-subHeader = response.content.strip('"')
+# Generated once per process, not on every rerun
+subHeader = get_subheading()
 
 with tab_chat:
     st.subheader(subHeader)
@@ -194,18 +162,29 @@ with tab_chat:
         if not question.strip():
             st.warning("Please enter a question.")
         else:
-            with st.spinner("Generating answer..."):
-                store = st.session_state["vectorstore"]
-                answer = generate_rag_answer(
+            st.write(f"**You:** {question}")
+            store = get_vectorstore()
+            answer = st.write_stream(
+                stream_rag_answer(
                     question,
                     store,
-                    st.session_state["chat_history"]
+                    st.session_state["chat_history"],
+                    current_summary()
                 )
+            )
 
             # Save chat
             st.session_state["chat_history"].append({"role": "user", "content": question})
             st.session_state["chat_history"].append({"role": "assistant", "content": answer})
 
+            # Fold turns that left the verbatim window into the rolling summary, in the background
+            # so the next turn doesn't wait on it; one update per session at a time
+            if st.session_state.get("summary_update") is None:
+                st.session_state["summary_update"] = get_context_builder().update_summary_async(
+                    st.session_state["chat_history"],
+                    current_summary()
+                )
+
             # Refresh UI
             st.rerun()
 
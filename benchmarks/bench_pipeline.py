@@ -0,0 +1,177 @@
+"""Offline benchmark for the RAG ingestion and retrieval pipeline.
+
+Builds synthetic PDF corpora of increasing size, ingests them with
+utils.ingest (PDFLoader -> TextCleaner -> TextChunker -> VectorStore, then one
+save) using the deterministic stand-ins from utils.fakes, and reports ingestion
+throughput, search latency percentiles, recall@k and peak memory. No network
+access is needed.
+
+    python -m benchmarks.bench_pipeline --pages 10 100 500 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+from utils import metrics
+from utils.embedding import EmbeddingCache, EmbeddingGenerator
+from utils.fakes import HashingEmbeddings
+from utils.ingest import ingest_files
+from utils.vectorstore import VectorStore
+
+PAGES_PER_FILE = 50
+FACTS_PER_PAGE = 4
+WORDS = (
+    "pump valve pressure sensor housing seal gasket motor bearing shaft flange coupling "
+    "filter inlet outlet torque voltage current assembly maintenance inspection replace "
+    "calibrate install remove tighten loosen check clean lubricate warning caution note"
+).split()
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: list):
+    # Minimal text-only PDF: one Helvetica content stream per page
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for lines in pages:
+        body = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) ' " for line in lines) + "ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_corpus(directory: str, total_pages: int, rng: random.Random):
+    # Every page carries a few unique part numbers with a fact sentence; they are the ground truth
+    facts = []
+    paths = []
+    for file_number in range(0, total_pages, PAGES_PER_FILE):
+        pages = []
+        for page_number in range(file_number, min(file_number + PAGES_PER_FILE, total_pages)):
+            lines = []
+            for fact_number in range(FACTS_PER_PAGE):
+                part = f"PN-{page_number:05d}-{fact_number}"
+                value = rng.randint(10, 999)
+                filler = " ".join(rng.choice(WORDS) for _ in range(60))
+                lines.append(f"Component {part} has a rated torque of {value} Nm.")
+                lines.extend(filler[i:i + 90] for i in range(0, len(filler), 90))
+                facts.append((part, value))
+            pages.append(lines)
+
+        path = os.path.join(directory, f"manual_{file_number // PAGES_PER_FILE:04d}.pdf")
+        write_pdf(path, pages)
+        paths.append(path)
+    return paths, facts
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_size(total_pages: int, n_queries: int, top_k: int, batch_size: int, seed: int,
+             index_type: str = "auto", effort: int = None) -> dict:
+    rng = random.Random(seed)
+    metrics.reset()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths, facts = make_corpus(tmp, total_pages, rng)
+
+        embedder = EmbeddingGenerator(
+            model="offline-hashing",
+            cache=EmbeddingCache(os.path.join(tmp, "embeddings.sqlite")),
+            embeddings=HashingEmbeddings()
+        )
+        store = VectorStore(persist_dir=os.path.join(tmp, "index"), embedder=embedder, index_type=index_type)
+
+        start = time.perf_counter()
+        chunks = ingest_files(store, paths, batch_size=batch_size)
+        ingest_seconds = time.perf_counter() - start
+
+        queries = rng.sample(facts, min(n_queries, len(facts)))
+        results = {
+            "index_type": store.active_type,
+            "pages": total_pages,
+            "chunks": chunks,
+            "ingest_s": ingest_seconds,
+            "pages_per_s": total_pages / ingest_seconds,
+            "chunks_per_s": chunks / ingest_seconds,
+        }
+
+        for mode in ("vector", "lexical", "hybrid"):
+            for style, template in (("question", "What is the rated torque of component {}?"), ("exact", "{}")):
+                latencies = []
+                hits = 0
+                for part, _ in queries:
+                    query = template.format(part)
+                    t0 = time.perf_counter()
+                    ids = store.search_ids(query, top_k=top_k, mode=mode, effort=effort)
+                    latencies.append(time.perf_counter() - t0)
+                    if any(part in text for text in store.get_texts(ids)):
+                        hits += 1
+
+                key = f"{mode}/{style}"
+                results[f"{key} p50_ms"] = metrics.percentile(latencies, 0.50) * 1000
+                results[f"{key} p95_ms"] = metrics.percentile(latencies, 0.95) * 1000
+                results[f"{key} p99_ms"] = metrics.percentile(latencies, 0.99) * 1000
+                results[f"{key} recall@{top_k}"] = hits / len(queries) if queries else 0.0
+
+        results["peak_rss_mb"] = peak_rss_mb()
+        results["stages"] = metrics.snapshot()["stages"]
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--index-type", default="auto", help="VectorStore backend: auto, flat, flat16, sq8, hnsw, ivfpq")
+    parser.add_argument("--effort", type=int, help="HNSW efSearch / IVF nprobe used for every search")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    all_results = []
+    for total_pages in args.pages:
+        results = run_size(total_pages, args.queries, args.top_k, args.batch_size, args.seed,
+                           args.index_type, args.effort)
+        all_results.append(results)
+
+        print(f"\n=== {total_pages} pages, {results['chunks']} chunks, {results['index_type']} index ===")
+        for key, value in results.items():
+            if key in ("stages", "index_type"):
+                continue
+            print(f"{key:32s} {value:12.3f}" if isinstance(value, float) else f"{key:32s} {value:12d}")
+        for stage, stats in sorted(results["stages"].items()):
+            print(f"stage {stage:26s} total={stats['total_ms']:10.1f}ms p50={stats['p50_ms']:8.3f}ms "
+                  f"p95={stats['p95_ms']:8.3f}ms calls={stats['calls']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Headless entry point: ingest PDFs, answer a JSONL file of questions, or serve HTTP.
+
+    python headless.py ingest manuals/*.pdf
+    python headless.py ask questions.jsonl -o answers.jsonl --concurrency 8
+    python headless.py serve --port 8080
+
+Input lines for `ask` are {"id": ..., "question": ...} ("id" is optional); a line
+that can't be parsed gets an {"id", "line", "error"} record and the run goes on.
+`serve` exposes POST /ask with {"question": ...} and GET /health.
+Shares the on-disk index and embedding cache and the prompt with app.py; the
+answer cache is in memory, so it is per process.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from utils import metrics
+from utils.rag import build_prompt, format_sources, retrieve_many
+from utils.resources import get_answer_cache, get_llm, get_vectorstore
+
+load_dotenv()
+
+logger = logging.getLogger("rag.headless")
+
+DEFAULT_CONCURRENCY = int(os.getenv("HEADLESS_CONCURRENCY", "8"))
+DEFAULT_BATCH_SIZE = int(os.getenv("HEADLESS_BATCH_SIZE", "64"))
+DEFAULT_RETRIES = int(os.getenv("HEADLESS_RETRIES", "5"))
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+
+def is_retryable(exc) -> bool:
+    import openai
+    return isinstance(exc, (openai.RateLimitError, openai.APITimeoutError,
+                            openai.APIConnectionError, openai.InternalServerError))
+
+
+def backoff_delay(exc, attempt: int) -> float:
+    # Honour the server's Retry-After when it sends one, otherwise exponential backoff with jitter
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        delay = BASE_DELAY * 2 ** attempt
+    return min(delay, MAX_DELAY) + random.uniform(0, BASE_DELAY)
+
+
+def call_with_backoff(fn, retries: int = DEFAULT_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as exc:
+            if attempt == retries or not is_retryable(exc):
+                raise
+            delay = backoff_delay(exc, attempt)
+            metrics.count("headless.retries")
+            logger.warning("%s, retrying in %.1fs", type(exc).__name__, delay)
+            time.sleep(delay)
+
+
+async def acall_with_backoff(make_call, retries: int = DEFAULT_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            return await make_call()
+        except Exception as exc:
+            if attempt == retries or not is_retryable(exc):
+                raise
+            delay = backoff_delay(exc, attempt)
+            metrics.count("headless.retries")
+            logger.warning("%s, retrying in %.1fs", type(exc).__name__, delay)
+            await asyncio.sleep(delay)
+
+
+def question_error(item):
+    # Why a request/input line can't be answered, or None
+    if not isinstance(item, dict):
+        return "not a JSON object"
+    question = item.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return '"question" must be a non-empty string'
+    return None
+
+
+def read_questions(path):
+    # (line number, item, error) per non-blank line; bad lines are reported, not fatal
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield number, None, f"invalid JSON: {exc}"
+                continue
+            yield number, item, question_error(item)
+
+
+async def retrieve_batch(store, questions, retries):
+    # Embedding + search are blocking; run them off the event loop in one batched call
+    return await asyncio.to_thread(call_with_backoff, lambda: retrieve_many(questions, store), retries)
+
+
+async def answer_one(store, question, query_embedding, ids, version, semaphore, retries):
+    cache = get_answer_cache()
+    cached = cache.get(question, query_embedding, ids, version)
+    if cached is not None:
+        metrics.count("answer_cache.hits")
+        return cached
+
+    docs = store.get_documents(ids)
+    prompt = build_prompt(question, docs)
+
+    async with semaphore:
+        start = time.perf_counter()
+        response = await acall_with_backoff(lambda: get_llm().ainvoke(prompt), retries)
+        metrics.record("llm", time.perf_counter() - start)
+
+    answer = response.content + format_sources(docs)
+    cache.put(question, query_embedding, ids, version, answer)
+    return answer
+
+
+class QueryBatcher:
+    # Collects questions arriving within `window` seconds (up to max_batch) into one embedding request
+
+    def __init__(self, store, max_batch: int, window: float, retries: int):
+        self.store = store
+        self.max_batch = max_batch
+        self.window = window
+        self.retries = retries
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def submit(self, question):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((question, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            metrics.count("headless.embedding_batches")
+            try:
+                results = await retrieve_batch(self.store, [q for q, _ in batch], self.retries)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def cmd_ingest(args):
+    from utils.ingest import ingest_files
+
+    store = get_vectorstore(args.index_dir)
+    added = ingest_files(store, args.files)
+    print(f"Added {added} chunks from {len(args.files)} file(s)")
+    metrics.log_snapshot()
+
+
+async def answer_file(args):
+    store = get_vectorstore(args.index_dir)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    items = list(read_questions(args.questions))
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for start in range(0, len(items), args.batch_size):
+            batch = items[start:start + args.batch_size]
+            valid = [item for _, item, error in batch if error is None]
+            version = store.version
+            try:
+                retrieved = await retrieve_batch(store, [item["question"] for item in valid], args.retries) if valid else []
+            except Exception as exc:
+                logger.error("Retrieval failed for lines %d-%d: %s", batch[0][0], batch[-1][0], exc)
+                retrieved = [exc] * len(valid)
+            retrieved = iter(retrieved)
+
+            async def answer(item, result):
+                started = time.perf_counter()
+                record = {"id": item.get("id"), "question": item["question"]}
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    query_embedding, ids = result
+                    record["answer"] = await answer_one(store, item["question"], query_embedding, ids,
+                                                        version, semaphore, args.retries)
+                except Exception as exc:
+                    logger.error("Question %r failed: %s", item.get("id"), exc)
+                    record["error"] = f"{type(exc).__name__}: {exc}"
+                record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return record
+
+            async def reject(number, item, error):
+                logger.error("Line %d skipped: %s", number, error)
+                return {"id": item.get("id") if isinstance(item, dict) else None, "line": number, "error": error}
+
+            records = await asyncio.gather(*(
+                reject(number, item, error) if error else answer(item, next(retrieved))
+                for number, item, error in batch
+            ))
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    metrics.log_snapshot()
+
+
+def cmd_ask(args):
+    asyncio.run(answer_file(args))
+
+
+def cmd_serve(args):
+    from aiohttp import web
+
+    store = get_vectorstore(args.index_dir)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    batcher = QueryBatcher(store, args.batch_size, args.batch_window / 1000, args.retries)
+
+    async def handle_ask(request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({"error": "body must be JSON"}, status=400)
+        error = question_error(body)
+        if error:
+            return web.json_response({"error": error}, status=400)
+
+        question = body["question"].strip()
+
+        version = store.version
+        try:
+            query_embedding, ids = await batcher.submit(question)
+            answer = await answer_one(store, question, query_embedding, ids, version, semaphore, args.retries)
+        except Exception as exc:
+            logger.error("Question failed: %s", exc)
+            return web.json_response({"error": f"{type(exc).__name__}: {exc}"}, status=502)
+
+        return web.json_response({"answer": answer})
+
+    async def handle_health(request):
+        return web.json_response({"status": "ok", "version": store.version})
+
+    async def on_startup(app):
+        batcher.start()
+
+    app = web.Application()
+    app.router.add_post("/ask", handle_ask)
+    app.router.add_get("/health", handle_health)
+    app.on_startup.append(on_startup)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index-dir", help="defaults to VECTOR_INDEX_DIR, or vector_index(_offline)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="index PDF files")
+    ingest.add_argument("files", nargs="+")
+    ingest.set_defaults(func=cmd_ingest)
+
+    for name, func, help_text in (("ask", cmd_ask, "answer a JSONL file of questions"),
+                                  ("serve", cmd_serve, "serve POST /ask over HTTP")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                         help="maximum LLM calls in flight")
+        sub.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                         help="questions per embedding request")
+        sub.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                         help="retries on rate limits and transient API errors")
+        sub.set_defaults(func=func)
+
+    ask = subparsers.choices["ask"]
+    ask.add_argument("questions")
+    ask.add_argument("-o", "--output", help="write answers here instead of stdout")
+
+    serve = subparsers.choices["serve"]
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--batch-window", type=float, default=10,
+                       help="milliseconds to wait while collecting questions into one embedding request")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
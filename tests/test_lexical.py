@@ -0,0 +1,34 @@
+from utils.cleaner import TextCleaner
+from utils.lexical import LexicalIndex
+
+TEXTS = [
+    "Replace the seal on part_no_77 after 500 hours of operation.",
+    "Valve A/B-12 must be checked before every start.",
+    "The pump housing is rated for 16 bar.",
+]
+
+
+def make_index():
+    index = LexicalIndex()
+    index.add([str(i) for i in range(len(TEXTS))], [TextCleaner.clean(text) for text in TEXTS])
+    return index
+
+
+def test_identifiers_survive_cleaning():
+    index = make_index()
+    for query, expected in (("part_no_77", "0"), ("A/B-12", "1")):
+        results = index.search(TextCleaner.clean(query))
+        assert results and results[0][0] == expected
+        assert index.is_confident(TextCleaner.clean(query), results)
+
+
+def test_identifier_parts_are_searchable():
+    results = make_index().search("part no 77")
+    assert results[0][0] == "0"
+
+
+def test_remove():
+    index = make_index()
+    index.remove(["0"], [TextCleaner.clean(TEXTS[0])])
+    assert index.search("part_no_77") == []
+    assert len(index) == 2
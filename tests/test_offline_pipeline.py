@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_openai")
+pytest.importorskip("pypdf")
+
+from benchmarks.bench_pipeline import write_pdf
+from utils import resources
+from utils.ingest import ingest_files
+from utils.rag import generate_rag_answer
+
+FACTORIES = (resources.get_llm, resources.get_embedder, resources.get_encoding, resources.get_vectorstore,
+             resources.get_context_builder, resources.get_answer_cache)
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    # Relative defaults (.cache/, vector_index_offline/) land in tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RAG_OFFLINE", "1")
+    monkeypatch.delenv("VECTOR_INDEX_DIR", raising=False)
+    for factory in FACTORIES:
+        factory.cache_clear()
+    yield tmp_path
+    for factory in FACTORIES:
+        factory.cache_clear()
+
+
+def test_ingest_search_answer(offline):
+    pages = [
+        [f"Component PN-{page}{n} has a rated torque of {page * 10 + n} Nm." for n in range(4)]
+        for page in range(1, 4)
+    ]
+    write_pdf("manual.pdf", pages)
+
+    store = resources.get_vectorstore()
+    assert os.path.basename(store.persist_dir) == "vector_index_offline"
+    assert ingest_files(store, ["manual.pdf"]) > 0
+    assert ingest_files(store, ["manual.pdf"]) == 0   # already indexed
+
+    for mode in ("vector", "lexical", "hybrid"):
+        docs = store.search_documents("rated torque of component PN-22", top_k=3, mode=mode)
+        assert any("PN-22" in doc.page_content for doc in docs), mode
+        assert all(doc.metadata["filename"].endswith("manual.pdf") for doc in docs)
+
+    answer = generate_rag_answer("What is the rated torque of component PN-22?", store, [])
+    assert "manual.pdf p.2" in answer
+
+    # A new process reopens the same offline index
+    resources.get_vectorstore.cache_clear()
+    assert resources.get_vectorstore().has_file(next(iter(store.file_hashes)))
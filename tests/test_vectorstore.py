@@ -0,0 +1,146 @@
+import os
+import pickle
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from utils import index_types, vectorstore
+from utils.embedding import EmbeddingCache, EmbeddingGenerator
+from utils.fakes import HashingEmbeddings
+from utils.vectorstore import DOCSTORE_FILE, INDEX_FILE, VectorStore
+
+
+def make_embedder(tmp_path):
+    return EmbeddingGenerator(
+        model="offline-hashing",
+        cache=EmbeddingCache(str(tmp_path / "embeddings.sqlite")),
+        embeddings=HashingEmbeddings()
+    )
+
+
+def part_texts(start, count):
+    return [f"Component PN-{i:05d} has a rated torque of {i % 97} Nm." for i in range(start, start + count)]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "flat16", "sq8", "hnsw", "ivfpq"])
+def test_persist_reload_add(tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(index_types, "IVFPQ_MIN_VECTORS", 300)
+    persist_dir = str(tmp_path / "index")
+
+    store = VectorStore(persist_dir, embedder=make_embedder(tmp_path), index_type=index_type)
+    store.add(part_texts(0, 500), metadatas=[{"file_hash": "a"} for _ in range(500)])
+    store.mark_files({"a"})
+    assert store.active_type == index_type
+
+    reloaded = VectorStore(persist_dir, embedder=make_embedder(tmp_path), index_type=index_type)
+    assert reloaded.active_type == index_type
+    assert reloaded.has_file("a")
+    assert reloaded._mmapped == (index_type != "ivfpq")
+    reloaded.add(part_texts(500, 100), metadatas=[{"file_hash": "b"} for _ in range(100)])
+    reloaded.mark_files({"b"})
+
+    again = VectorStore(persist_dir, embedder=make_embedder(tmp_path), index_type=index_type)
+    assert again.store.index.ntotal == 600
+    assert "PN-00550" in again.search("PN-00550", top_k=1, mode="lexical")[0]
+    assert any("PN-00042" in text for text in again.search("rated torque of component PN-00042", top_k=3))
+    assert len(os.listdir(persist_dir)) == 3   # CURRENT, LOCK and one generation directory
+
+
+def test_load_state_without_newer_keys(tmp_path):
+    persist_dir = str(tmp_path / "index")
+    store = VectorStore(embedder=make_embedder(tmp_path))
+    store.add(part_texts(0, 50))
+
+    # Layout and state written by older versions: files directly in persist_dir, fewer keys
+    os.makedirs(persist_dir)
+    faiss.write_index(store.store.index, os.path.join(persist_dir, INDEX_FILE))
+    with open(os.path.join(persist_dir, DOCSTORE_FILE), "wb") as f:
+        pickle.dump({
+            "docstore": store.store.docstore,
+            "index_to_docstore_id": store.store.index_to_docstore_id,
+            "file_hashes": {"a"}
+        }, f)
+
+    loaded = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+    assert loaded.active_type == "flat"
+    assert loaded.built_for == 50
+    assert "PN-00007" in loaded.search("PN-00007", top_k=1, mode="lexical")[0]
+
+    loaded.add(part_texts(50, 10))
+    loaded.save()
+    assert not os.path.exists(os.path.join(persist_dir, INDEX_FILE))
+    assert VectorStore(persist_dir, embedder=make_embedder(tmp_path)).store.index.ntotal == 60
+
+
+def test_remove_files_before_retry(tmp_path):
+    store = VectorStore(embedder=make_embedder(tmp_path))
+    store.add(part_texts(0, 40), metadatas=[{"file_hash": "a"} for _ in range(40)])
+    store.add(part_texts(100, 20), metadatas=[{"file_hash": "b"} for _ in range(20)])
+
+    # A failed ingest of "b" is retried: its partial chunks are dropped, then re-added
+    assert store.remove_files({"b"}) == 20
+    for mode in ("vector", "lexical"):
+        assert not any("PN-001" in text for text in store.search("PN-00105", top_k=5, mode=mode))
+    store.add(part_texts(100, 20), metadatas=[{"file_hash": "b"} for _ in range(20)])
+
+    assert len(store.texts_for_files({"b"})) == 20
+    assert store.search("PN-00105", top_k=1, mode="lexical") == [part_texts(105, 1)[0]]
+
+    # Switching backend compacts the removed vectors away
+    store._install(*store._rebuild("hnsw", []))
+    assert store.store.index.ntotal == 60
+    assert part_texts(105, 1)[0] in store.search("rated torque of PN-00105", top_k=3, mode="vector")
+
+
+def test_refuses_other_embedding_model(tmp_path):
+    persist_dir = str(tmp_path / "index")
+    store = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+    store.add(part_texts(0, 10))
+    store.save()
+
+    other = EmbeddingGenerator(
+        model="other-model",
+        cache=EmbeddingCache(str(tmp_path / "embeddings.sqlite")),
+        embeddings=HashingEmbeddings(dimensions=64)
+    )
+    with pytest.raises(ValueError, match="offline-hashing"):
+        VectorStore(persist_dir, embedder=other)
+
+    store.embedder = other
+    with pytest.raises(ValueError, match="64-dim"):
+        store.add(part_texts(10, 1))
+
+
+def test_two_processes_share_persist_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "REFRESH_INTERVAL", 0)
+    persist_dir = str(tmp_path / "index")
+    first = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+    second = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+
+    # Both started from the same (empty) state; the later save must not drop the earlier one
+    first.add(part_texts(0, 20), metadatas=[{"file_hash": "a"} for _ in range(20)])
+    first.mark_files({"a"})
+    second.add(part_texts(100, 20), metadatas=[{"file_hash": "b"} for _ in range(20)])
+    second.mark_files({"b"})
+
+    assert second.has_file("a") and second.has_file("b")
+    assert first.has_file("b")   # noticed the other save through CURRENT
+    assert first.search("PN-00105", top_k=1, mode="lexical") == [part_texts(105, 1)[0]]
+
+    reopened = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+    assert reopened.store.index.ntotal == 40
+    assert len([name for name in os.listdir(persist_dir) if name.startswith("gen-")]) == 1
+
+
+def test_same_file_ingested_by_two_processes(tmp_path):
+    persist_dir = str(tmp_path / "index")
+    first = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+    second = VectorStore(persist_dir, embedder=make_embedder(tmp_path))
+
+    for store in (first, second):
+        store.add(part_texts(0, 20), metadatas=[{"file_hash": "a"} for _ in range(20)])
+        store.mark_files({"a"})
+
+    assert len(second.texts_for_files({"a"})) == 20
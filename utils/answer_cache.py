@@ -0,0 +1,79 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _cache_key(chunk_ids, history_text):
+    # The retrieved chunks as a set (rank order doesn't change the prompt's facts) plus a
+    # fingerprint of the packed history, so one session never gets another's answer
+    return frozenset(chunk_ids), hashlib.sha256(history_text.encode("utf-8")).hexdigest()
+
+
+def _normalize(query):
+    return " ".join(query.lower().split())
+
+
+# Answers keyed by (corpus version, retrieved chunk ids, chat history); a hit also needs
+# the same question text, or a query embedding within `threshold` cosine similarity of
+# the cached question. Lexical fast-path questions have no embedding and match on text.
+class AnswerCache:
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = None
+        self._entries = OrderedDict()   # (chunk_key, n) -> (question, query_embedding, answer, created)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _sync_version(self, version):
+        # Any change to the corpus invalidates every cached answer
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, query, query_embedding, chunk_ids, version, history_text=""):
+        chunk_key = _cache_key(chunk_ids, history_text)
+        question = _normalize(query)
+        now = time.time()
+
+        with self._lock:
+            self._sync_version(version)
+
+            for key, (cached_question, embedding, answer, created) in list(self._entries.items()):
+                if now - created > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                # Only questions that retrieved the same chunks with the same history are compared
+                if key[0] != chunk_key:
+                    continue
+                if question == cached_question or (
+                    query_embedding is not None and embedding is not None
+                    and _cosine(query_embedding, embedding) >= self.threshold
+                ):
+                    self._entries.move_to_end(key)
+                    return answer
+
+        return None
+
+    def put(self, query, query_embedding, chunk_ids, version, answer, history_text=""):
+        with self._lock:
+            self._sync_version(version)
+
+            self._counter += 1
+            self._entries[(_cache_key(chunk_ids, history_text), self._counter)] = (
+                _normalize(query),
+                list(query_embedding) if query_embedding is not None else None,
+                answer,
+                time.time()
+            )
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -1,12 +1,30 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from utils import metrics
+
 class TextChunker:
     
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
+            chunk_overlap=chunk_overlap,
+            add_start_index=True
         )
         
     def chunk_text(self, text: str) -> list:
-        return self.text_splitter.split_text(text)    
\ No newline at end of file
+        return self.text_splitter.split_text(text)
+
+    def chunk_pages(self, pages):
+        # Yield (text, metadata) per chunk as pages stream in; metadata carries provenance
+        for page in pages:
+            metadata = {
+                "filename": page["filename"],
+                "file_hash": page.get("file_hash"),
+                "page": page.get("page")
+            }
+            with metrics.timed("chunk"):
+                docs = self.text_splitter.create_documents([page["text"]], [metadata])
+            for doc in docs:
+                metadata = dict(doc.metadata)
+                metadata["offset"] = metadata.pop("start_index")
+                yield doc.page_content, metadata
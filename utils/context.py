@@ -0,0 +1,149 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+from utils.resources import get_encoding
+
+logger = logging.getLogger("rag.context")
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Update the summary with the new messages. Keep facts, names, numbers and open
+questions the assistant may need later, in at most {max_words} words; drop the
+least useful details first. Reply with the updated summary only.
+"""
+
+
+def format_turns(history: list) -> str:
+    return "\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in history)
+
+
+class ContextBuilder:
+    def __init__(self, llm, token_budget: int = 3000, recent_messages: int = 6,
+                 history_share: float = 0.35, summary_share: float = 0.5, min_overlap: int = 20,
+                 max_overlap: int = 400, encoding: str = "cl100k_base"):
+        self.llm = llm
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.history_share = history_share
+        self.summary_share = summary_share   # part of the history budget the rolling summary may use
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.encoding = get_encoding(encoding)
+        self._summaries = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text)
+        return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+
+    def dedupe_chunks(self, chunks: list) -> list:
+        # Merge chunks that share the splitter's overlap, drop ones contained in another.
+        # Spans keep the rank of the first chunk that created them.
+        spans = []
+        for chunk in chunks:
+            for i, span in enumerate(spans):
+                if chunk in span:
+                    break
+                if span in chunk:
+                    spans[i] = chunk
+                    break
+                merged = self._merge(span, chunk) or self._merge(chunk, span)
+                if merged:
+                    spans[i] = merged
+                    break
+            else:
+                spans.append(chunk)
+        return spans
+
+    def _merge(self, left: str, right: str):
+        longest = min(len(left), len(right), self.max_overlap)
+        for size in range(longest, self.min_overlap - 1, -1):
+            if left.endswith(right[:size]):
+                return left + right[size:]
+        return None
+
+    def update_summary(self, history: list, state: dict) -> dict:
+        # Fold messages that aged out of the verbatim window into the rolling summary.
+        # Only the newly aged messages are sent, never the whole history.
+        older = history[:-self.recent_messages] if self.recent_messages else history
+        folded = state.get("folded", 0)
+        if len(older) <= folded:
+            return state
+
+        # ~0.75 words per token keeps the summary inside its share of the history budget
+        summary_budget = int(self.token_budget * self.history_share * self.summary_share)
+        prompt = SUMMARY_PROMPT.format(
+            summary=state.get("summary") or "(empty)",
+            messages=format_turns(older[folded:]),
+            max_words=max(summary_budget * 3 // 4, 20)
+        )
+        summary = self.llm.invoke(prompt).content.strip()
+        return {"summary": summary, "folded": len(older)}
+
+    def update_summary_async(self, history: list, state: dict):
+        # Runs update_summary off the request path and returns a Future of the new state.
+        # A failed call resolves to the previous state, so the same turns are retried next time.
+        history, state = list(history), dict(state)
+
+        def run():
+            try:
+                with metrics.timed("summary"):
+                    return self.update_summary(history, state)
+            except Exception as exc:
+                logger.warning("Summary update failed, keeping the previous summary: %s", exc)
+                metrics.count("summary.failures")
+                return state
+
+        return self._summaries.submit(run)
+
+    def pack_history(self, query: str, history: list, state: dict = None):
+        state = state or {}
+        budget = self.token_budget - self.count_tokens(query)
+        history_budget = int(budget * self.history_share)
+
+        # History: rolling summary of older turns, then as many recent turns as fit, newest first
+        history_parts = []
+        used = 0
+        summary = state.get("summary")
+        if summary:
+            # An over-long summary is cut to its share rather than dropped
+            summary_text = self.truncate(f"SUMMARY OF EARLIER CONVERSATION: {summary}",
+                                         int(history_budget * self.summary_share))
+            history_parts.append(summary_text)
+            used += self.count_tokens(summary_text)
+
+        recent = history[state.get("folded", 0):][-self.recent_messages:] if self.recent_messages else []
+        kept = []
+        for msg in reversed(recent):
+            line = format_turns([msg])
+            tokens = self.count_tokens(line)
+            if used + tokens > history_budget:
+                break
+            kept.append(line)
+            used += tokens
+        history_parts.extend(reversed(kept))
+
+        return "\n".join(history_parts), used
+
+    def pack_context(self, query: str, chunks: list, used: int = 0) -> str:
+        # Retrieved chunks fill whatever budget the history left, in rank order
+        budget = self.token_budget - self.count_tokens(query)
+        context_parts = []
+        for span in self.dedupe_chunks(chunks):
+            tokens = self.count_tokens(span)
+            if used + tokens > budget:
+                continue
+            context_parts.append(span)
+            used += tokens
+
+        return "\n\n".join(context_parts)
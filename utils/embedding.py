@@ -1,15 +1,161 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 
 from dotenv import load_dotenv
 
+from utils import metrics
+from utils.resources import offline_mode
+
 load_dotenv()
 
-class EmbeddingGenerator:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+DEFAULT_MODEL = "text-embedding-3-small"
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+DEFAULT_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+OFFLINE_MODEL = "offline-hashing"
+
+
+# On-disk embedding cache keyed by sha256(model, text).
+# Bounded by max_entries; least recently used rows are evicted first.
+class EmbeddingCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+        return found
+
+    def put_many(self, items: dict):
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+
+
+class EmbeddingGenerator(Embeddings):
+    # `embeddings` swaps in any langchain Embeddings (e.g. utils.fakes.HashingEmbeddings);
+    # `model` is part of the cache key, so give stand-ins their own name
+    def __init__(self, model: str = None, cache: EmbeddingCache = None, embeddings: Embeddings = None):
+        if embeddings is None and offline_mode():
+            from utils.fakes import HashingEmbeddings
+            embeddings = HashingEmbeddings()
+            model = model or OFFLINE_MODEL
+
+        self.model = model or DEFAULT_MODEL
+        self.embeddings = embeddings if embeddings is not None else OpenAIEmbeddings(model=self.model)
+        self.cache = cache if cache is not None else EmbeddingCache()
 
     def embed(self, texts: list):
-        return self.embeddings.embed_documents(texts)
+        keys = [EmbeddingCache.key(self.model, t) for t in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        # Only send each distinct uncached text to the API once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        metrics.count("embed.cache_hits", len(keys) - len(missing))
+        metrics.count("embed.cache_misses", len(missing))
+
+        if missing:
+            with metrics.timed("embed"):
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    def cached(self, texts: list) -> list:
+        # Cache-only lookup: the vector for each text, or None, without calling the API
+        keys = [EmbeddingCache.key(self.model, t) for t in texts]
+        found = self.cache.get_many(list(set(keys)))
+        return [found.get(key) for key in keys]
 
     def embed_query(self, query: str):
-        return self.embeddings.embed_query(query)
+        key = EmbeddingCache.key(self.model, query)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            metrics.count("embed_query.cache_hits")
+            return cached[key]
+
+        metrics.count("embed_query.cache_misses")
+        with metrics.timed("embed_query"):
+            vector = self.embeddings.embed_query(query)
+        self.cache.put_many({key: vector})
+        return vector
+
+    # langchain Embeddings interface, so FAISS can use this class directly
+    def embed_documents(self, texts: list):
+        return self.embed(texts)
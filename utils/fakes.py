@@ -0,0 +1,86 @@
+import hashlib
+import math
+import re
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+# Deterministic local stand-ins for OpenAIEmbeddings, ChatOpenAI and tiktoken, used when
+# RAG_OFFLINE=1 and by the benchmark suite. No network access, same input -> same output.
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+class HashingEmbeddings(Embeddings):
+    # Feature-hashed bag of words: texts sharing words get similar vectors,
+    # so retrieval quality is meaningful in benchmarks
+    def __init__(self, dimensions: int = 256, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _embed(self, text: str) -> list:
+        vector = [0.0] * self.dimensions
+        for word in WORD_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+
+class CharEncoding:
+    # Length-based stand-in for a tiktoken encoding (~4 characters per token), so token
+    # budgets work without downloading BPE files
+    chars_per_token = 4
+
+    def encode(self, text: str) -> list:
+        return [text[i:i + self.chars_per_token] for i in range(0, len(text), self.chars_per_token)]
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+
+class EchoChatModel(SimpleChatModel):
+    # Replies with the first words of the last message; streams word by word
+    reply_words: int = 40
+    latency: float = 0.0          # delay before the first token
+    token_latency: float = 0.0    # delay between tokens
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _reply(self, messages) -> str:
+        words = str(messages[-1].content).split()
+        return " ".join(words[:self.reply_words])
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reply(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for i, word in enumerate(self._reply(messages).split(" ")):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,87 @@
+import math
+import os
+
+import faiss
+import numpy as np
+
+# FAISS index backends VectorStore can build, from exact to compressed:
+#   flat    - exact float32 (what FAISS.from_texts builds)
+#   flat16  - exact scan over float16 vectors, half the RAM
+#   sq8     - exact scan over int8 scalar-quantized vectors, a quarter of the RAM
+#   hnsw    - HNSW graph over float16 vectors, sub-linear search
+#   ivfpq   - inverted lists + product quantization, tens of bytes per vector
+INDEX_TYPES = ("flat", "flat16", "sq8", "hnsw", "ivfpq")
+
+# "auto" picks by corpus size
+AUTO_HNSW_MIN = int(os.getenv("VECTOR_AUTO_HNSW_MIN", "50000"))
+AUTO_IVFPQ_MIN = int(os.getenv("VECTOR_AUTO_IVFPQ_MIN", "1000000"))
+
+# IVF-PQ needs enough vectors to train its coarse quantizer and codebooks;
+# below this an explicit "ivfpq" request is served by a flat index
+IVFPQ_MIN_VECTORS = 10000
+
+# Trained backends are retrained once the corpus grows this many times past their training size
+TRAINED_TYPES = ("sq8", "ivfpq")
+RETRAIN_GROWTH = 4
+
+MAX_TRAINING_VECTORS = 100000
+DEFAULT_EFFORT = 64
+REBUILD_BATCH = 10000
+
+
+def choose_index_type(requested: str, total: int) -> str:
+    if requested == "auto":
+        if total >= AUTO_IVFPQ_MIN:
+            return "ivfpq"
+        if total >= AUTO_HNSW_MIN:
+            return "hnsw"
+        return "flat"
+
+    if requested not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {requested!r}; expected 'auto' or one of {INDEX_TYPES}")
+
+    if requested == "ivfpq" and total < IVFPQ_MIN_VECTORS:
+        return "flat"
+    return requested
+
+
+def _pq_subquantizers(dim: int) -> int:
+    for m in (64, 48, 32, 24, 16, 8, 4, 2):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_spec(index_type: str, dim: int, total: int) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "flat16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "hnsw":
+        return "HNSW32,SQfp16"
+    if index_type == "ivfpq":
+        nlist = max(1, min(int(4 * math.sqrt(total)), total // 39))
+        # "np": skip polysemous training, which costs minutes and whose codes are never used
+        return f"IVF{nlist},PQ{_pq_subquantizers(dim)}x8np"
+    raise ValueError(f"Unknown index type {index_type!r}")
+
+
+def new_index(index_type: str, dim: int, total: int):
+    return faiss.index_factory(dim, index_spec(index_type, dim, total))
+
+
+def training_positions(total: int, seed: int = 0) -> list:
+    if total <= MAX_TRAINING_VECTORS:
+        return list(range(total))
+    rng = np.random.default_rng(seed)
+    return sorted(rng.choice(total, MAX_TRAINING_VECTORS, replace=False).tolist())
+
+
+def set_effort(index, index_type: str, effort: int, top_k: int):
+    # One recall/latency knob: HNSW efSearch or IVF nprobe. Flat indexes are exact and ignore it.
+    if index_type == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", max(effort, top_k))
+    elif index_type == "ivfpq":
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", effort)
@@ -0,0 +1,60 @@
+import os
+
+from utils.chunker import TextChunker
+from utils.cleaner import TextCleaner
+from utils.loader import PDFLoader, file_hash
+
+# Load -> clean -> chunk -> embed & store, shared by app.py and headless.py.
+# Pages stream through the stages, so memory holds a bounded window of pages
+# (see utils.loader.TASKS_PER_WORKER) plus one batch, not the whole upload.
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+
+def ingest_pdfs(store, pdf_paths, skip_hashes=None, batch_size=INGEST_BATCH_SIZE, on_page=None):
+    # Returns the number of chunks added; files already in skip_hashes are not parsed.
+    # on_page(page, pages_seen_for_file) is called for progress reporting.
+    # An earlier ingest of these files may have failed after adding some batches but before
+    # mark_files; drop those chunks first so the retry doesn't duplicate them
+    skip_hashes = set(skip_hashes or ())
+    store.remove_files({file_hash(path) for path in pdf_paths} - skip_hashes)
+
+    cleaner = TextCleaner()
+    chunker = TextChunker()
+    loader = PDFLoader(pdf_paths)
+
+    def report_progress(pages):
+        seen = {}
+        for page in pages:
+            seen[page["filename"]] = seen.get(page["filename"], 0) + 1
+            if on_page:
+                on_page(page, seen[page["filename"]])
+            yield page
+
+    pages = report_progress(loader.iter_pages(skip_hashes=skip_hashes))
+
+    added = 0
+    batch_texts, batch_metadatas = [], []
+    for text, metadata in chunker.chunk_pages(cleaner.clean_pages(pages)):
+        batch_texts.append(text)
+        batch_metadatas.append(metadata)
+        if len(batch_texts) >= batch_size:
+            store.add(batch_texts, metadatas=batch_metadatas)
+            added += len(batch_texts)
+            batch_texts, batch_metadatas = [], []
+
+    if batch_texts:
+        store.add(batch_texts, metadatas=batch_metadatas)
+        added += len(batch_texts)
+
+    return added
+
+
+def ingest_files(store, pdf_paths, batch_size=INGEST_BATCH_SIZE, on_page=None):
+    # Hash, skip what is already indexed, ingest the rest and record them as indexed
+    hashes = {path: file_hash(path) for path in pdf_paths}
+    new_paths = [path for path, h in hashes.items() if not store.has_file(h)]
+
+    added = ingest_pdfs(store, new_paths, batch_size=batch_size, on_page=on_page)
+    store.mark_files(set(hashes.values()))
+    return added
@@ -0,0 +1,85 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+# Identifiers such as "E-1042", "v2.3.1" or "part_no_77" stay whole; their parts are indexed too.
+# Documents arrive through TextCleaner, so queries must be cleaned the same way (VectorStore does).
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(match)
+        parts = PART_PATTERN.findall(match)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+# In-process BM25 inverted index over the same chunks as the FAISS index
+class LexicalIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_ids: list, texts: list):
+        for doc_id, text in zip(doc_ids, texts):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                self.postings[term][doc_id] = tf
+            length = sum(counts.values())
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
+
+    def remove(self, doc_ids: list, texts: list):
+        for doc_id, text in zip(doc_ids, texts):
+            if doc_id not in self.doc_lengths:
+                continue
+            for term in set(tokenize(text)):
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query: str, k: int = 5) -> list:
+        if not self.doc_lengths:
+            return []
+
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs
+        scores = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def is_confident(self, query: str, results: list, margin: float = 1.5) -> bool:
+        # Confident when the best hit contains every query token and clearly beats the runner-up
+        if not results:
+            return False
+
+        best_id, best_score = results[0]
+        terms = set(tokenize(query))
+        if not terms or any(best_id not in self.postings.get(t, {}) for t in terms):
+            return False
+
+        return len(results) == 1 or best_score >= margin * results[1][1]
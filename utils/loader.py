@@ -1,24 +1,105 @@
+import hashlib
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 from pypdf import PdfReader
 
+from utils import metrics
+
+PAGES_PER_TASK = 8
+TASKS_PER_WORKER = 2   # extraction may run this far ahead of the consumer, no further
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_pages(path: str, start: int, stop: int):
+    # Runs in a worker process; returns (page_number, text) for pages [start, stop)
+    reader = PdfReader(path)
+    pages = []
+    for number in range(start, stop):
+        # Empty pages are still reported so callers can tell when a file is complete
+        pages.append((number, reader.pages[number].extract_text() or ""))
+    return pages
+
+
 class PDFLoader:
-    def __init__(self, file_paths: list):
+    def __init__(self, file_paths: list, max_workers: int = None):
         self.file_paths = file_paths
+        self.max_workers = max_workers or os.cpu_count()
 
     def load_pdfs(self):
         documents = []
 
         for path in self.file_paths:
             reader = PdfReader(path)
-            text = ""
+            pages = []
 
             for page in reader.pages:
                 extracted = page.extract_text()
                 if extracted:
-                    text += extracted + "\n"
+                    pages.append(extracted + "\n")
 
             documents.append({
                 "filename": path,
-                "text": text
+                "text": "".join(pages)
             })
 
         return documents
+
+    def iter_pages(self, skip_hashes=None):
+        # "load" time covers hashing and waiting on workers, not the consumer's work between pages
+        return metrics.timed_iter("load", self._iter_pages(skip_hashes))
+
+    def _tasks(self, skip_hashes):
+        # (path, digest, page_count, start, stop) per page range, produced lazily.
+        # Files whose content hash is in skip_hashes are not parsed at all.
+        for path in self.file_paths:
+            digest = file_hash(path)
+            if digest in skip_hashes:
+                metrics.count("load.skipped_files")
+                continue
+
+            page_count = len(PdfReader(path).pages)
+            for start in range(0, page_count, PAGES_PER_TASK):
+                yield path, digest, page_count, start, min(start + PAGES_PER_TASK, page_count)
+
+    def _iter_pages(self, skip_hashes=None):
+        # Extract pages across a process pool and yield each page as soon as it is ready.
+        # Only a bounded number of tasks is in flight and each is dropped once consumed,
+        # so memory holds a window of pages, not the whole upload.
+        tasks = self._tasks(skip_hashes or set())
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = {}
+
+            def submit_next():
+                task = next(tasks, None)
+                if task is not None:
+                    path, digest, page_count, start, stop = task
+                    in_flight[pool.submit(_extract_pages, path, start, stop)] = (path, digest, page_count)
+
+            for _ in range(self.max_workers * TASKS_PER_WORKER):
+                submit_next()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, digest, page_count = in_flight.pop(future)
+                    pages = future.result()
+                    submit_next()
+
+                    metrics.count("load.pages", len(pages))
+                    for number, text in pages:
+                        yield {
+                            "filename": path,
+                            "file_hash": digest,
+                            "page": number + 1,
+                            "page_count": page_count,
+                            "text": text
+                        }
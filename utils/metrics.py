@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Process-wide stage timings and counters. Always on: each timing is one
+# perf_counter pair and a locked append, cheap next to any pipeline stage.
+
+logger = logging.getLogger("rag.metrics")
+
+SAMPLES_PER_STAGE = 1000
+
+_lock = threading.Lock()
+_timings = defaultdict(lambda: {"calls": 0, "total": 0.0, "max": 0.0,
+                                "samples": deque(maxlen=SAMPLES_PER_STAGE)})
+_counters = defaultdict(int)
+
+
+def record(stage: str, seconds: float):
+    with _lock:
+        entry = _timings[stage]
+        entry["calls"] += 1
+        entry["total"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+        entry["samples"].append(seconds)
+    logger.debug("%s took %.2f ms", stage, seconds * 1000)
+
+
+def count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def timed_iter(stage: str, iterable):
+    # Times only the work done producing each item, not the consumer's work between items
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(stage, time.perf_counter() - start)
+        yield item
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def snapshot() -> dict:
+    with _lock:
+        stages = {
+            stage: {
+                "calls": entry["calls"],
+                "total_ms": entry["total"] * 1000,
+                "mean_ms": entry["total"] * 1000 / entry["calls"] if entry["calls"] else 0.0,
+                "p50_ms": percentile(entry["samples"], 0.50) * 1000,
+                "p95_ms": percentile(entry["samples"], 0.95) * 1000,
+                "max_ms": entry["max"] * 1000
+            }
+            for stage, entry in _timings.items()
+        }
+        return {"stages": stages, "counters": dict(_counters)}
+
+
+def log_snapshot(level: int = logging.INFO):
+    data = snapshot()
+    for stage, stats in sorted(data["stages"].items()):
+        logger.log(level, "%-12s calls=%d total=%.1fms p50=%.2fms p95=%.2fms max=%.2fms",
+                   stage, stats["calls"], stats["total_ms"], stats["p50_ms"], stats["p95_ms"], stats["max_ms"])
+    for name, value in sorted(data["counters"].items()):
+        logger.log(level, "%-12s %d", name, value)
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
@@ -0,0 +1,120 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+from utils.resources import get_answer_cache, get_context_builder, get_llm
+
+# RAG prompt and answer flow shared by app.py and headless.py
+
+RAG_PROMPT = """
+    You are an AI RAG Assistant.
+
+    Use ONLY the context below + conversation history to answer.
+
+    === RAG CONTEXT ===
+    {context}
+
+    === CHAT HISTORY ===
+    {history}
+
+    === USER QUESTION ===
+    {query}
+
+    Provide a helpful and contextual reply.
+    """
+
+TOP_K = 3
+
+
+def format_sources(docs):
+    # Cite chunks straight from their provenance metadata, e.g. "manual.pdf p.4"
+    cited = []
+    for doc in docs:
+        filename = doc.metadata.get("filename")
+        if not filename:
+            continue
+        label = os.path.basename(filename)
+        if doc.metadata.get("page"):
+            label += f" p.{doc.metadata['page']}"
+        if label not in cited:
+            cited.append(label)
+
+    return f"\n\n*Sources: {', '.join(cited)}*" if cited else ""
+
+
+def retrieve(query, vectorstore, top_k=TOP_K):
+    # Returns (query_embedding, ids); the embedding is None when BM25 answered alone
+    ids, query_embedding = vectorstore.search_with_embedding(query, top_k)
+    return query_embedding, ids
+
+
+def retrieve_many(queries, vectorstore, top_k=TOP_K):
+    # Confident lexical matches skip embedding; the rest share one embedding request
+    # instead of one round trip per question
+    fast = [vectorstore.lexical_fast_path(query, top_k) for query in queries]
+    pending = [query for query, ids in zip(queries, fast) if ids is None]
+    query_embeddings = iter(vectorstore.embedder.embed(pending) if pending else [])
+
+    results = []
+    for query, ids in zip(queries, fast):
+        if ids is not None:
+            results.append((None, ids))
+            continue
+        embedding = next(query_embeddings)
+        results.append((embedding, vectorstore.search_ids(query, top_k, query_embedding=embedding)))
+    return results
+
+
+def build_prompt(query, docs, history_text="", used=0):
+    # Deduplicated chunks fill whatever the history left of the token budget
+    results = [doc.page_content for doc in docs]
+    context = get_context_builder().pack_context(query, results, used) or "No relevant context found."
+    return RAG_PROMPT.format(context=context, history=history_text, query=query)
+
+
+def stream_rag_answer(query, vectorstore, history, history_state=None):
+    builder = get_context_builder()
+    cache = get_answer_cache()
+    version = vectorstore.version
+
+    # Embed + search on a worker thread while the history is packed
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        search = pool.submit(retrieve, query, vectorstore)
+
+        # Rolling summary + recent turns, within the history share of the token budget
+        history_text, used = builder.pack_history(query, history, history_state)
+
+        query_embedding, ids = search.result()
+
+    # Same chunks + same history + near-identical question against an unchanged index: reuse the answer
+    cached = cache.get(query, query_embedding, ids, version, history_text)
+    if cached is not None:
+        metrics.count("answer_cache.hits")
+        yield cached
+        return
+
+    docs = vectorstore.get_documents(ids)
+    prompt = build_prompt(query, docs, history_text, used)
+
+    # Yield tokens as they arrive so the UI can render them immediately
+    tokens = []
+    start = time.perf_counter()
+    for chunk in get_llm().stream(prompt):
+        if chunk.content:
+            if not tokens:
+                metrics.record("llm.first_token", time.perf_counter() - start)
+            tokens.append(chunk.content)
+            yield chunk.content
+    metrics.record("llm", time.perf_counter() - start)
+
+    sources = format_sources(docs)
+    if sources:
+        tokens.append(sources)
+        yield sources
+
+    cache.put(query, query_embedding, ids, version, "".join(tokens), history_text)
+
+
+def generate_rag_answer(query, vectorstore, history, history_state=None):
+    return "".join(stream_rag_answer(query, vectorstore, history, history_state))
@@ -0,0 +1,143 @@
+import os
+import threading
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process-wide resources, created on first use and then shared by every
+# Streamlit rerun and session (and by headless callers). Heavy libraries
+# (langchain, faiss, tiktoken, openai) are only imported inside the factories,
+# so importing this module is cheap.
+
+DEFAULT_CHAT_MODEL = "gpt-4o-mini"
+DEFAULT_SUBHEADING = "Your smart companion for answers, assistance and conversation."
+
+
+def offline_mode() -> bool:
+    return os.getenv("RAG_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def default_index_dir() -> str:
+    # Offline stand-in vectors get their own index so they never meet real ones
+    return os.getenv("VECTOR_INDEX_DIR", "vector_index_offline" if offline_mode() else "vector_index")
+
+
+def _once(factory):
+    # lru_cache plus a per-factory lock, so concurrent sessions never build the same resource twice
+    cached = lru_cache(maxsize=None)(factory)
+    lock = threading.RLock()
+
+    def wrapper(*args, **kwargs):
+        with lock:
+            return cached(*args, **kwargs)
+
+    wrapper.cache_clear = cached.cache_clear
+    wrapper.__name__ = factory.__name__
+    return wrapper
+
+
+@_once
+def get_llm(model: str = DEFAULT_CHAT_MODEL):
+    # One client per model; its HTTP connection pool is reused across questions, reruns and sessions
+    if offline_mode():
+        from utils.fakes import EchoChatModel
+        return EchoChatModel()
+
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, streaming=True)
+
+
+@_once
+def get_encoding(name: str = "cl100k_base"):
+    # tiktoken downloads its BPE files on first use, so offline mode counts characters instead
+    if offline_mode():
+        from utils.fakes import CharEncoding
+        return CharEncoding()
+
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+@_once
+def get_embedder():
+    from utils.embedding import EmbeddingGenerator
+    return EmbeddingGenerator()
+
+
+@_once
+def _vectorstore(persist_dir: str):
+    from utils.vectorstore import VectorStore
+    return VectorStore(
+        persist_dir,
+        embedder=get_embedder(),
+        index_type=os.getenv("VECTOR_INDEX_TYPE", "auto")
+    )
+
+
+def get_vectorstore(persist_dir: str = None):
+    # One persistent index per process, shared by every session; saved to disk after each ingest.
+    # The path is normalized first so "vector_index", "./vector_index" and the default share one store.
+    return _vectorstore(os.path.abspath(persist_dir or default_index_dir()))
+
+
+get_vectorstore.cache_clear = _vectorstore.cache_clear
+
+
+@_once
+def get_context_builder():
+    from utils.context import ContextBuilder
+    return ContextBuilder(
+        get_llm(),
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+        recent_messages=int(os.getenv("CONTEXT_RECENT_MESSAGES", "6"))
+    )
+
+
+@_once
+def get_answer_cache():
+    # Invalidated whenever the vector store version changes
+    from utils.answer_cache import AnswerCache
+    return AnswerCache(
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+    )
+
+
+@_once
+def get_summarizer():
+    # Cached partial summaries live as long as the process
+    from utils.summarizer import HierarchicalSummarizer
+    return HierarchicalSummarizer(
+        get_llm(),
+        batch_tokens=int(os.getenv("SUMMARY_BATCH_TOKENS", "6000")),
+        max_parallel=int(os.getenv("SUMMARY_MAX_PARALLEL", "4"))
+    )
+
+
+@_once
+def get_subheading() -> str:
+    # Generated at most once per process; APP_SUBHEADING skips the LLM call entirely
+    static = os.getenv("APP_SUBHEADING")
+    if static:
+        return static
+
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system",
+         "You are a creative branding expert. Your job is to craft short, catchy, and modern subheadings for digital products. "
+         "Make it sound premium, memorable, and friendly. Output only the subheading, without quotes."),
+
+        ("human",
+         "Create a cool subheading for my AI chatbot that helps users with answers, assistance, and conversations.")
+    ])
+
+    try:
+        response = get_llm().invoke(prompt.format_messages())
+    except Exception:
+        return DEFAULT_SUBHEADING
+
+    return response.content.strip('"') or DEFAULT_SUBHEADING
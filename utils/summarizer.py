@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.resources import get_encoding
+
+MAP_PROMPT = """
+You are an AI Research Assistant specialized in summarization.
+
+Summarize the following part of a longer document.
+Keep every key fact, name and number; the result will be merged with
+summaries of the other parts.
+
+DOCUMENT PART:
+{text}
+
+Rules:
+- Do NOT add extra information.
+"""
+
+REDUCE_PROMPT = """
+You are an AI Research Assistant specialized in summarization.
+
+Summarize the following document.
+
+Summary type: {summary_type}
+
+DOCUMENT CONTENT:
+{text}
+
+Rules:
+- Do NOT add extra information.
+- Keep the summary clean and structured.
+- If summary_type = "bullet", return bullet points.
+- If short, keep within 150 words.
+- If detailed, keep within 500 words.
+"""
+
+
+class HierarchicalSummarizer:
+    def __init__(self, llm, batch_tokens: int = 6000, max_parallel: int = 4,
+                 encoding: str = "cl100k_base"):
+        self.llm = llm
+        self.batch_tokens = batch_tokens
+        self.max_parallel = max_parallel
+        self.encoding = get_encoding(encoding)
+        self._partials = {}   # batch hash -> summary, independent of summary_type
+        self._lock = threading.Lock()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def summarize(self, chunks: list, summary_type: str = "detailed") -> str:
+        texts = list(chunks)
+
+        # Reduce level by level until everything fits in a single final call
+        while sum(self.count_tokens(t) for t in texts) > self.batch_tokens and len(texts) > 1:
+            texts = self._summarize_batches(self._batch(texts))
+
+        prompt = REDUCE_PROMPT.format(summary_type=summary_type, text="\n\n".join(texts))
+        return self.llm.invoke(prompt).content.strip()
+
+    def _batch(self, texts: list) -> list:
+        batches = []
+        current, current_tokens = [], 0
+
+        for text in texts:
+            tokens = self.count_tokens(text)
+            # At least two texts per batch, so every level strictly shrinks
+            if len(current) >= 2 and current_tokens + tokens > self.batch_tokens:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    def _summarize_batches(self, batches: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            return list(pool.map(self._summarize_batch, batches))
+
+    def _summarize_batch(self, batch: list) -> str:
+        text = "\n\n".join(batch)
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            if key in self._partials:
+                return self._partials[key]
+
+        summary = self.llm.invoke(MAP_PROMPT.format(text=text)).content.strip()
+
+        with self._lock:
+            self._partials[key] = summary
+        return summary
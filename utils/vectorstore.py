@@ -1,32 +1,500 @@
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from utils import metrics
+from utils.cleaner import TextCleaner
 from utils.embedding import EmbeddingGenerator
+from utils.index_types import (
+    DEFAULT_EFFORT,
+    REBUILD_BATCH,
+    RETRAIN_GROWTH,
+    TRAINED_TYPES,
+    choose_index_type,
+    new_index,
+    set_effort,
+    training_positions,
+)
+from utils.lexical import LexicalIndex
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+EXACT_TYPES = ("flat", "flat16", "hnsw")   # backends that can hand their float vectors back
+MMAP_TYPES = ("flat", "flat16", "sq8", "hnsw")   # flat-code storage that FAISS can memory-map
+CURRENT_FILE = "CURRENT"   # names the generation directory holding the live index + docstore
+LOCK_FILE = "LOCK"
+REFRESH_INTERVAL = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "2"))
+RRF_K = 60
+
+logger = logging.getLogger("rag.vectorstore")
+
+
+class VectorsUnavailable(RuntimeError):
+    pass
+
+
+@contextmanager
+def _file_lock(path: str, exclusive: bool = True):
+    # Serializes processes sharing a persist_dir: saves lock exclusively, loads shared
+    with open(path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
 
 class VectorStore:
-    def __init__(self):
-        self.embedder = EmbeddingGenerator()
+    def __init__(self, persist_dir: str = None, embedder: EmbeddingGenerator = None, index_type: str = "auto"):
+        self.embedder = embedder or EmbeddingGenerator()
         self.store = None   # will hold FAISS index
+        self.persist_dir = persist_dir
+        self.index_type = index_type   # requested backend, see utils.index_types
+        self.active_type = None        # backend actually built for the current corpus size
+        self.built_for = 0             # corpus size the active index was built/trained for
+        self._lock = threading.RLock()         # guards what searches read; held only briefly
+        self._write_lock = threading.RLock()   # serializes add/remove/save, held during training
+        self._generation = None   # generation directory this process last loaded or saved
+        self._mmapped = False
+        self._checked = 0.0
+        # Changes not saved yet; replayed onto the on-disk state if another process saved meanwhile
+        self._pending_ids = []
+        self._pending_removed = set()
+        self._pending_marked = set()
+        self.file_hashes = set()   # content hashes of files already indexed
+        self.lexical = LexicalIndex()
+        self.version = 0   # bumped on every change so caches can tell the corpus changed
+
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            with _file_lock(self._lock_path(), exclusive=False):
+                self._load()
+
+    def has_file(self, file_hash: str) -> bool:
+        self.refresh()
+        return file_hash in self.file_hashes
+
+    def mark_files(self, file_hashes):
+        # Called once an ingest has added all its chunks; this is also when the index is persisted
+        with self._write_lock:
+            self.file_hashes.update(file_hashes)
+            self._pending_marked.update(file_hashes)
+            self.save()
+
+    def save(self):
+        # Searches keep running while the index is written; only writers wait.
+        # Other processes may share persist_dir (app.py + headless.py): if one saved since we
+        # loaded, start from its state and replay our changes, so neither side loses files.
+        with self._write_lock:
+            if not self.persist_dir or self.store is None:
+                return
+            with _file_lock(self._lock_path()), metrics.timed("index.save"):
+                if self._current_generation() != self._generation:
+                    self._merge_saved()
+                self._save()
+            self._pending_ids, self._pending_removed, self._pending_marked = [], set(), set()
+
+    def refresh(self) -> bool:
+        # Picks up saves made by other processes; checks CURRENT at most every REFRESH_INTERVAL.
+        # Skipped while this process has unsaved changes: its next save merges instead.
+        if not self.persist_dir or time.monotonic() - self._checked < REFRESH_INTERVAL:
+            return False
+        self._checked = time.monotonic()
+        if self._current_generation() == self._generation:
+            return False
+        if not self._write_lock.acquire(blocking=False):
+            return False
+        try:
+            if self._pending_ids or self._pending_removed or self._pending_marked:
+                return False
+            with _file_lock(self._lock_path(), exclusive=False):
+                self._load()
+            metrics.count("index.reloads")
+            return True
+        finally:
+            self._write_lock.release()
+
+    def remove_files(self, file_hashes) -> int:
+        # Drops every chunk of these files, e.g. left behind by an ingest that failed before
+        # mark_files. Vectors stay in the index as tombstones until the next rebuild.
+        with self._write_lock, self._lock:
+            if self.store is None or not file_hashes:
+                return 0
+            docs = self.store.docstore._dict
+            ids = [doc_id for doc_id, doc in docs.items() if doc.metadata.get("file_hash") in file_hashes]
+            if not ids:
+                return 0
+            self._pending_removed.update(file_hashes)
+
+            self.lexical.remove(ids, [docs[doc_id].page_content for doc_id in ids])
+            self.store.docstore.delete(ids)
+            self.file_hashes.difference_update(file_hashes)
+            self.version += 1
+            metrics.count("index.removed_chunks", len(ids))
+            return len(ids)
+
+    def texts_for_files(self, file_hashes) -> list:
+        with self._lock:
+            if self.store is None:
+                return []
+            docs = [d for d in self.store.docstore._dict.values() if d.metadata.get("file_hash") in file_hashes]
+
+        # Pages are ingested out of order; restore document order
+        docs.sort(key=lambda d: (d.metadata.get("filename", ""), d.metadata.get("page") or 0, d.metadata.get("offset") or 0))
+        return [d.page_content for d in docs]
 
-    def add(self, texts):
+    def add(self, texts, metadatas=None):
+        if not texts:
+            return
+
+        # Embed once; every vector goes through the embedding cache
         embeddings = self.embedder.embed(texts)
+        ids = [str(uuid.uuid4()) for _ in texts]
+        metrics.count("index.chunks", len(texts))
+
+        with self._write_lock, metrics.timed("index"):
+            self._add_embeddings(texts, embeddings, metadatas, ids)
+
+    def _add_embeddings(self, texts, embeddings, metadatas, ids):
+        # Training and rebuilds run under the write lock only and swap the new index in
+        # at the end, so searches are never blocked behind them
+        if self.store is not None and len(embeddings[0]) != self.store.index.d:
+            raise ValueError(
+                f"{self.embedder.model!r} returns {len(embeddings[0])}-dim vectors but the index "
+                f"holds {self.store.index.d}-dim ones; use a separate VECTOR_INDEX_DIR per embedding model"
+            )
+
+        total = len(texts) + (self.store.index.ntotal if self.store is not None else 0)
+        desired = choose_index_type(self.index_type, total)
 
         # Create FAISS index first time
         if self.store is None:
-            self.store = FAISS.from_texts(
-                texts,
-                embedding=self.embedder.embeddings
+            index = new_index(desired, len(embeddings[0]), total)
+            if not index.is_trained:
+                index.train(np.array(embeddings, dtype=np.float32))
+            store = FAISS(
+                embedding_function=self.embedder,
+                index=index,
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={}
             )
-        else:
+            with self._lock:
+                self.store = store
+                self.active_type, self.built_for = desired, total
+        elif desired != self.active_type:
+            # Corpus crossed a size threshold: move to the better backend
+            self._install(*self._rebuild(desired, embeddings))
+        elif desired in TRAINED_TYPES and total > RETRAIN_GROWTH * self.built_for:
+            self._retrain(embeddings)
+        elif self._mmapped:
+            # A memory-mapped index is read-only; take a private in-RAM copy before the first append
+            copy = faiss.deserialize_index(faiss.serialize_index(self.store.index))
+            self._install(copy, self.store.index_to_docstore_id, self.active_type, self.built_for)
+
+        with self._lock:
             # Add new texts + embeddings
-            self.store.add_texts(
-                texts,
-                embeddings=embeddings
-            )
+            self.store.add_embeddings(list(zip(texts, embeddings)), metadatas=metadatas, ids=ids)
+
+            # Keep the BM25 index in step with the vector index
+            self.lexical.add(ids, texts)
+            self._pending_ids.extend(ids)
+            self.version += 1
 
-    def search(self, query, top_k=5):
+    def search(self, query, top_k=5, mode="hybrid", effort=None):
+        # mode: "vector", "lexical" or "hybrid" (reciprocal rank fusion of both)
+        # effort: recall/latency knob for approximate indexes (HNSW efSearch / IVF nprobe)
         if self.store is None:
             return []
 
-        query_embedding = self.embedder.embed_query(query)
-        docs = self.store.similarity_search_by_vector(query_embedding, k=top_k)
+        return self.get_texts(self.search_ids(query, top_k, mode, effort=effort))
+
+    def search_documents(self, query, top_k=5, mode="hybrid", effort=None):
+        # Like search, but returns Documents whose metadata cites filename, page and offset
+        if self.store is None:
+            return []
+
+        return self.get_documents(self.search_ids(query, top_k, mode, effort=effort))
+
+    def search_ids(self, query, top_k=5, mode="hybrid", query_embedding=None, effort=None):
+        return self.search_with_embedding(query, top_k, mode, query_embedding, effort)[0]
+
+    def search_with_embedding(self, query, top_k=5, mode="hybrid", query_embedding=None, effort=None):
+        # Returns (ids, query_embedding); the query is only embedded when the vector side
+        # actually runs, so the embedding is None after a lexical fast path
+        self.refresh()
+        with metrics.timed("search"):
+            return self._search_ids(query, top_k, mode, query_embedding, effort)
+
+    def lexical_fast_path(self, query, top_k=5):
+        # Ids when BM25 alone is confident (exact identifiers/titles), otherwise None
+        self.refresh()
+        if self.store is None:
+            return None
+
+        lexical_hits, confident = self._lexical_hits(query, top_k)
+        if not confident:
+            return None
+        metrics.count("search.lexical_fast_path")
+        return [doc_id for doc_id, _ in lexical_hits[:top_k]]
+
+    def get_documents(self, ids) -> list:
+        with self._lock:
+            return [self.store.docstore.search(i) for i in ids]
+
+    def get_texts(self, ids) -> list:
+        return [doc.page_content for doc in self.get_documents(ids)]
+
+    def _lexical_hits(self, query, top_k):
+        # Same character filter as the indexed text, so identifiers tokenize identically
+        query = TextCleaner.clean(query)
+        with self._lock:
+            lexical_hits = self.lexical.search(query, k=top_k * 2)
+            return lexical_hits, self.lexical.is_confident(query, lexical_hits)
+
+    def _search_ids(self, query, top_k, mode, query_embedding, effort):
+        if self.store is None:
+            return [], query_embedding
+
+        lexical_hits = []
+        if mode in ("lexical", "hybrid"):
+            lexical_hits, confident = self._lexical_hits(query, top_k)
+            if mode == "lexical":
+                return [doc_id for doc_id, _ in lexical_hits[:top_k]], query_embedding
+
+            # Exact identifiers/titles: answer without an embedding round trip
+            if confident:
+                if query_embedding is None:
+                    metrics.count("search.lexical_fast_path")
+                return [doc_id for doc_id, _ in lexical_hits[:top_k]], query_embedding
+
+        if query_embedding is None:
+            query_embedding = self.embedder.embed_query(query)
+        vector_hits = self._vector_search(query_embedding, top_k * 2 if lexical_hits else top_k, effort)
+        if not lexical_hits:
+            return [doc_id for doc_id, _ in vector_hits[:top_k]], query_embedding
+
+        fused = {}
+        for hits in (vector_hits, lexical_hits):
+            for rank, (doc_id, _) in enumerate(hits):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        return sorted(fused, key=fused.get, reverse=True)[:top_k], query_embedding
+
+    def _vector_search(self, query_embedding, k, effort=None):
+        vector = np.array([query_embedding], dtype=np.float32)
+        with self._lock:
+            id_map = self.store.index_to_docstore_id
+            docs = self.store.docstore._dict
+            # Over-fetch by the number of removed chunks still in the index, then skip them
+            fetch = k + len(id_map) - len(docs)
+            set_effort(self.store.index, self.active_type, effort or DEFAULT_EFFORT, fetch)
+            distances, indices = self.store.index.search(vector, fetch)
+            hits = [(id_map[i], float(d)) for d, i in zip(distances[0], indices[0]) if i != -1 and id_map[i] in docs]
+            return hits[:k]
+
+    def _stored_vectors(self, positions):
+        # Exact-storage indexes give their vectors back directly. Quantized ones can't, and
+        # re-sending the corpus to the embedding API is not an option, so their float
+        # vectors must still be in the embedding cache.
+        if self.active_type in EXACT_TYPES:
+            return self.store.index.reconstruct_batch(np.array(positions, dtype=np.int64))
+
+        id_map = self.store.index_to_docstore_id
+        texts = [self.store.docstore.search(id_map[i]).page_content for i in positions]
+        vectors = self.embedder.cached(texts)
+        missing = sum(v is None for v in vectors)
+        if missing:
+            raise VectorsUnavailable(
+                f"{missing} of {len(texts)} vectors needed to rebuild the {self.active_type} index are "
+                f"no longer in the embedding cache; raise EMBEDDING_CACHE_MAX_ENTRIES or re-ingest"
+            )
+        return np.array(vectors, dtype=np.float32)
+
+    def _retrain(self, new_embeddings):
+        # Trained backends drift as the corpus grows; retrain when the float vectors are
+        # still available, otherwise keep serving from the current training
+        try:
+            self._install(*self._rebuild(self.active_type, new_embeddings))
+        except VectorsUnavailable as exc:
+            logger.warning("Keeping the current %s training: %s", self.active_type, exc)
+            metrics.count("index.retrains_skipped")
+            self.built_for = self.store.index.ntotal + len(new_embeddings)
+
+    def _rebuild(self, index_type, new_embeddings):
+        # Builds the replacement index next to the live one (called under the write lock, so
+        # the live one only sees reads). Removed chunks are left out, so this also compacts.
+        id_map = self.store.index_to_docstore_id
+        live = [p for p in range(self.store.index.ntotal) if id_map[p] in self.store.docstore._dict]
+        total = len(live) + len(new_embeddings)
+        index = new_index(index_type, self.store.index.d, total)
+
+        if not index.is_trained:
+            positions = training_positions(total)
+            old = [live[p] for p in positions if p < len(live)]
+            new = [new_embeddings[p - len(live)] for p in positions if p >= len(live)]
+            sample = np.vstack([
+                self._stored_vectors(old).reshape(-1, index.d),
+                np.array(new, dtype=np.float32).reshape(-1, index.d)
+            ])
+            index.train(sample)
+
+        # Copy existing vectors over in batches so memory stays bounded
+        for start in range(0, len(live), REBUILD_BATCH):
+            index.add(self._stored_vectors(live[start:start + REBUILD_BATCH]))
+
+        metrics.count("index.rebuilds")
+        return index, {i: id_map[p] for i, p in enumerate(live)}, index_type, total
+
+    def _install(self, index, id_map, index_type, total):
+        with self._lock:
+            self.store.index = index
+            self.store.index_to_docstore_id = id_map
+            self.active_type, self.built_for = index_type, total
+            self._mmapped = False
+
+    def _lock_path(self):
+        return os.path.join(self.persist_dir, LOCK_FILE)
+
+    def _current_generation(self):
+        # None while the directory is empty or still in the older flat layout
+        current = os.path.join(self.persist_dir, CURRENT_FILE)
+        if not os.path.exists(current):
+            return None
+        with open(current) as f:
+            return f.read().strip()
+
+    def _merge_saved(self):
+        # Another process saved since we loaded: reload its state, then replay our unsaved
+        # removals, chunks and marked files on top of it
+        docs = self.store.docstore._dict
+        positions = {doc_id: p for p, doc_id in self.store.index_to_docstore_id.items()}
+        ids = [doc_id for doc_id in self._pending_ids if doc_id in docs]
+        texts = [docs[doc_id].page_content for doc_id in ids]
+        metadatas = [docs[doc_id].metadata for doc_id in ids]
+        vectors = self._stored_vectors([positions[doc_id] for doc_id in ids]).tolist() if ids else []
+        removed, marked = self._pending_removed, self._pending_marked
+
+        self._load()
+
+        # Files the other process finished meanwhile win; our copies of them would be duplicates
+        done = set(self.file_hashes)
+        self.remove_files(removed - done)
+        keep = [i for i, metadata in enumerate(metadatas) if metadata.get("file_hash") not in done]
+        if keep:
+            self._add_embeddings([texts[i] for i in keep], [vectors[i] for i in keep],
+                                 [metadatas[i] for i in keep], [ids[i] for i in keep])
+        self.file_hashes.update(marked)
+        metrics.count("index.merges")
+
+    def _load(self):
+        # Callers hold the persist_dir file lock. Older indexes were written straight into persist_dir.
+        generation = self._current_generation()
+        directory = os.path.join(self.persist_dir, generation) if generation else self.persist_dir
+        index_path = os.path.join(directory, INDEX_FILE)
+        docstore_path = os.path.join(directory, DOCSTORE_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(docstore_path)):
+            return
+
+        with open(docstore_path, "rb") as f:
+            state = pickle.load(f)
+
+        # Vectors from another embedding model (e.g. the offline stand-in) must never mix in
+        model = state.get("embedding_model")
+        if model is not None and model != self.embedder.model:
+            raise ValueError(
+                f"The index in {self.persist_dir} was built with {model!r} embeddings, not "
+                f"{self.embedder.model!r}; use a separate VECTOR_INDEX_DIR per embedding model"
+            )
+
+        # Map flat-code indexes instead of reading them, so startup doesn't grow with the corpus
+        active_type = state.get("active_type", "flat")
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        mmapped = False
+        if active_type in MMAP_TYPES and mmap_flag is not None:
+            try:
+                index = faiss.read_index(index_path, mmap_flag)
+                mmapped = True
+            except RuntimeError:
+                index = faiss.read_index(index_path)
+        else:
+            index = faiss.read_index(index_path)
+
+        lexical = state.get("lexical")
+        if lexical is None:
+            docs = state["docstore"]._dict
+            lexical = LexicalIndex()
+            lexical.add(list(docs), [doc.page_content for doc in docs.values()])
+
+        with self._lock:
+            self.store = FAISS(
+                embedding_function=self.embedder,
+                index=index,
+                docstore=state["docstore"],
+                index_to_docstore_id=state["index_to_docstore_id"]
+            )
+            # Indexes saved by older versions lack some of these keys
+            self.file_hashes = state.get("file_hashes", set())
+            self.active_type = active_type
+            self.built_for = state.get("built_for", index.ntotal)
+            self.lexical = lexical
+            self._mmapped = mmapped
+            self._generation = generation
+            self.version += 1
+
+    def _save(self):
+        # Each save writes a fresh generation directory and then repoints CURRENT with a
+        # single rename, so the index and docstore on disk always belong together
+        generation = f"gen-{uuid.uuid4().hex[:12]}"
+        directory = os.path.join(self.persist_dir, generation)
+        os.makedirs(directory)
+
+        faiss.write_index(self.store.index, os.path.join(directory, INDEX_FILE))
+        with open(os.path.join(directory, DOCSTORE_FILE), "wb") as f:
+            pickle.dump({
+                "docstore": self.store.docstore,
+                "index_to_docstore_id": self.store.index_to_docstore_id,
+                "file_hashes": self.file_hashes,
+                "lexical": self.lexical,
+                "active_type": self.active_type,
+                "built_for": self.built_for,
+                "embedding_model": self.embedder.model
+            }, f)
+
+        current = os.path.join(self.persist_dir, CURRENT_FILE)
+        with open(current + ".tmp", "w") as f:
+            f.write(generation)
+        os.replace(current + ".tmp", current)
 
-        return [doc.page_content for doc in docs]
+        # Under the exclusive lock nobody is reading an older generation, so drop them all
+        # (including one orphaned by a crash); files of the older flat layout go too
+        for name in os.listdir(self.persist_dir):
+            if name.startswith("gen-") and name != generation:
+                shutil.rmtree(os.path.join(self.persist_dir, name), ignore_errors=True)
+        for name in (INDEX_FILE, DOCSTORE_FILE):
+            if os.path.exists(os.path.join(self.persist_dir, name)):
+                os.remove(os.path.join(self.persist_dir, name))
+        self._generation = generation
+        self._checked = time.monotonic()